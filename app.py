@@ -1,11 +1,35 @@
 from flask import Flask, request, jsonify, send_file
 import cv2
+from filelock import FileLock
 import numpy as np
+from numba import njit
+from redis import Redis
+from redis.exceptions import RedisError
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from scipy.optimize import linear_sum_assignment
+import torch
 from ultralytics import YOLO
 import os
+import importlib.util
 import uuid
 from collections import defaultdict
+import queue
 import tempfile
+import threading
+import unicodedata
+from urllib.parse import quote
+
+try:
+    from torchcodec.decoders import VideoDecoder  # Optional NVDEC hardware decoding
+except ImportError:
+    VideoDecoder = None
+
+try:
+    import av  # Optional NVENC hardware encoding
+except ImportError:
+    av = None
 
 app = Flask(__name__)
 
@@ -14,155 +38,451 @@ UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 
+# Internal nginx location serving OUTPUT_FOLDER (e.g. /_outputs/); when set, downloads
+# are handed to nginx via X-Accel-Redirect instead of being streamed by Flask
+ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX')
+
+# Number of frames sent to YOLO per inference call
+BATCH_SIZE = int(os.environ.get('YOLO_BATCH', 16))
+
+# Detection input size; frames are letterboxed down to this and boxes come back
+# in original frame coordinates
+IMG_SIZE = int(os.environ.get('YOLO_IMGSZ', 640))
+
+# Run the detector on every Nth frame only; frames in between reuse the tracker's
+# velocity-extrapolated boxes
+DETECT_EVERY = max(1, int(os.environ.get('DETECT_EVERY', 3)))
+
+# Annotation style (BGR colors)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+GREEN = (0, 255, 0)
+RED = (0, 0, 255)
+WHITE = (255, 255, 255)
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-# Load YOLO model
-model = YOLO('yolov8n.pt')  # Using YOLOv8 nano for speed
+# Run on the GPU in half precision when available, otherwise fall back to CPU
+DEVICE = 0 if torch.cuda.is_available() else 'cpu'
+QUANTIZE = 16 if DEVICE != 'cpu' else None  # ultralytics precision: 16 = FP16, None = FP32
+
+# Use a TensorRT engine on the GPU when TensorRT is installed (set YOLO_TENSORRT=0 to disable)
+USE_TENSORRT = os.environ.get('YOLO_TENSORRT', '1') == '1'
+
+# Dataset YAML with representative frames for INT8 calibration; unset keeps FP16
+INT8_DATA = os.environ.get('YOLO_INT8_DATA')
+
+def cached_export(weights, path, **kwargs):
+    """Export weights with ultralytics to path unless that export already exists."""
+    # ultralytics always exports next to the weights under the same name, so concurrent
+    # workers must take turns even when building different configurations
+    with FileLock(f"{os.path.splitext(weights)[0]}.export.lock"):
+        if not os.path.exists(path):
+            print(f"Exporting {path} (one-time)...")
+            exported = YOLO(weights).export(imgsz=IMG_SIZE, batch=BATCH_SIZE, **kwargs)
+            os.replace(exported, path)
+    return path
+
+def load_model(weights):
+    """Load YOLO weights, swapping in an optimized export when the runtime is installed:
+    a TensorRT engine (FP16, or INT8 with YOLO_INT8_DATA) on the GPU, or an INT8
+    OpenVINO model on the CPU when YOLO_INT8_DATA is set. Exports are built on first
+    use and cached per GPU architecture, precision, batch size and input size, since
+    they only run on the configuration they were built for."""
+    stem = os.path.splitext(weights)[0]
+    calibration = {'data': INT8_DATA} if INT8_DATA else {}
+    
+    if DEVICE == 'cpu':
+        if not INT8_DATA or importlib.util.find_spec('openvino') is None:
+            return YOLO(weights)
+        path = cached_export(weights, f"{stem}_int8_b{BATCH_SIZE}_{IMG_SIZE}_openvino_model",
+                             format='openvino', quantize=8, dynamic=True, **calibration)
+        return YOLO(path, task='detect')
+    
+    if not USE_TENSORRT or importlib.util.find_spec('tensorrt') is None:
+        return YOLO(weights)
+    
+    major, minor = torch.cuda.get_device_capability(DEVICE)
+    precision = 'int8' if INT8_DATA else 'fp16'
+    # dynamic=True lets the final, partial batch of a video run on the same engine
+    path = cached_export(weights, f"{stem}_sm{major}{minor}_{precision}_b{BATCH_SIZE}_{IMG_SIZE}.engine",
+                         format='engine', quantize=8 if INT8_DATA else 16, dynamic=True, device=DEVICE, **calibration)
+    return YOLO(path, task='detect')
+
+# YOLO model, loaded on first use so that web workers which only enqueue jobs never pay for it
+model = None
+
+def get_model():
+    global model
+    if model is None:
+        model = load_model('yolov8n.pt')  # Using YOLOv8 nano for speed
+    return model
+
+# Background job queue; /process enqueues videos for worker.py processes
+redis_conn = Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+job_queue = Queue(connection=redis_conn)
+JOB_TIMEOUT = os.environ.get('JOB_TIMEOUT', '1h')
+# How long /status/<job_id> can report a finished or failed job (-1 keeps it forever)
+JOB_RESULT_TTL = os.environ.get('JOB_RESULT_TTL', '7d')
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def read_frames(input_path, get_buffer):
+    """Yield BGR frames decoded into preallocated buffers from get_buffer(), stopping
+    early if it returns None. Decodes on the GPU (NVDEC) when torchcodec is available."""
+    if VideoDecoder is not None and DEVICE != 'cpu':
+        decoder = VideoDecoder(input_path, device='cuda')
+        for frame in decoder:
+            buf = get_buffer()
+            if buf is None:
+                return
+            # CHW RGB tensor on the GPU -> HWC BGR, copied straight into the host buffer
+            torch.from_numpy(buf).copy_(frame.flip(0).permute(1, 2, 0))
+            yield buf
+    else:
+        cap = cv2.VideoCapture(input_path)
+        try:
+            while True:
+                buf = get_buffer()
+                if buf is None:
+                    break
+                ret, frame = cap.read(buf)  # Decodes in place when buf has the frame's shape
+                if not ret:
+                    break
+                yield frame
+        finally:
+            cap.release()
+
+class NvencWriter:
+    """Drop-in for cv2.VideoWriter that encodes H.264 on the GPU (NVENC) via PyAV."""
+    
+    def __init__(self, output_path, fps, width, height, codec='h264_nvenc'):
+        self.container = av.open(output_path, 'w')
+        try:
+            self.stream = self.container.add_stream(codec, rate=fps)
+            self.stream.width = width
+            self.stream.height = height
+            self.stream.pix_fmt = 'yuv420p'
+            # Open the encoder now so a missing/unsupported GPU fails here, not mid-video
+            self.stream.codec_context.open()
+        except Exception:
+            self.container.close()
+            raise
+    
+    def write(self, frame):
+        av_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        for packet in self.stream.encode(av_frame):
+            self.container.mux(packet)
+    
+    def release(self):
+        # Flush buffered packets before closing the file
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+def open_writer(output_path, fps, width, height):
+    """Open an NVENC writer when possible, falling back to OpenCV's mp4v encoder."""
+    if av is not None and DEVICE != 'cpu':
+        try:
+            return NvencWriter(output_path, fps, width, height)
+        except (av.error.FFmpegError, ValueError) as e:  # ValueError: codec missing from this FFmpeg build
+            print(f"NVENC unavailable ({e}), falling back to OpenCV encoder")
+    
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    return cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+
+@njit(cache=True, fastmath=True)
+def centroid_costs(inp, trk, max_dist):
+    """Pairwise centroid distances, with pairs at or beyond max_dist set to 1e6."""
+    m = inp.shape[0]
+    n = trk.shape[0]
+    max_dist2 = max_dist * max_dist
+    cost = np.empty((m, n), dtype=np.float64)
+    for i in range(m):
+        for j in range(n):
+            dx = inp[i, 0] - trk[j, 0]
+            dy = inp[i, 1] - trk[j, 1]
+            d2 = dx * dx + dy * dy
+            cost[i, j] = np.sqrt(d2) if d2 < max_dist2 else 1e6
+    return cost
+
+# Compile the kernel at import time rather than on the first processed frame
+centroid_costs(np.zeros((1, 2), dtype=np.float32), np.zeros((1, 2), dtype=np.float32), 100.0)
+
 class PersonTracker:
-    def __init__(self):
-        self.tracks = {}
+    # Per-track state arrays, kept parallel by _add and _compact
+    _FIELDS = ('_ids', '_centroids', '_velocities', '_boxes', '_disappeared')
+    
+    def __init__(self, capacity=256):
         self.next_id = 1
         self.max_disappeared = 10
+        self.max_distance = 100
         
+        # Track state as parallel arrays; only the first _n slots are live
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._centroids = np.empty((capacity, 2), dtype=np.float32)
+        self._velocities = np.empty((capacity, 2), dtype=np.float32)  # Pixels per frame
+        self._boxes = np.empty((capacity, 4), dtype=np.float32)
+        self._disappeared = np.empty(capacity, dtype=np.int32)
+        self._n = 0
+        self._steps = 0  # predict() calls since the last update()
+    
+    def _add(self, centroids, boxes):
+        """Start a new, stationary track for each centroid."""
+        n, k = self._n, len(centroids)
+        if n + k > len(self._ids):
+            capacity = max(n + k, 2 * len(self._ids))
+            for name in self._FIELDS:
+                old = getattr(self, name)
+                new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:n] = old[:n]
+                setattr(self, name, new)
+        
+        self._ids[n:n + k] = np.arange(self.next_id, self.next_id + k)
+        self._centroids[n:n + k] = centroids
+        self._velocities[n:n + k] = 0
+        self._boxes[n:n + k] = boxes
+        self._disappeared[n:n + k] = 0
+        self._n += k
+        self.next_id += k
+    
+    def _compact(self, keep):
+        """Drop the live tracks where keep is False, preserving order."""
+        n = self._n
+        k = int(np.count_nonzero(keep))
+        for name in self._FIELDS:
+            arr = getattr(self, name)
+            arr[:k] = arr[:n][keep]
+        self._n = k
+    
+    def _no_detections(self, frames=1):
+        """Mark all existing tracks as disappeared for the given number of frames and
+        drop the expired ones."""
+        n = self._n
+        self._disappeared[:n] += frames
+        self._compact(self._disappeared[:n] <= self.max_disappeared)
+    
+    def predict(self):
+        """Advance every track by its velocity for a frame that was not run through
+        the detector, and return the extrapolated boxes of the currently visible tracks."""
+        n = self._n
+        self._centroids[:n] += self._velocities[:n]
+        self._boxes[:n] += np.tile(self._velocities[:n], 2)
+        self._steps += 1
+        return self._boxes[:n][self._disappeared[:n] == 0]
+    
     def update(self, detections):
+        n = self._n
+        steps = self._steps
+        self._steps = 0
+        # max_disappeared is in video frames, including those predict() covered
+        elapsed = steps + 1
         if len(detections) == 0:
-            # Mark all existing tracks as disappeared
-            for track_id in list(self.tracks.keys()):
-                self.tracks[track_id]['disappeared'] += 1
-                if self.tracks[track_id]['disappeared'] > self.max_disappeared:
-                    del self.tracks[track_id]
+            self._no_detections(elapsed)
             return []
         
         # Simple centroid tracking
-        input_centroids = []
-        for (x1, y1, x2, y2) in detections:
-            cx = int((x1 + x2) / 2)
-            cy = int((y1 + y2) / 2)
-            input_centroids.append((cx, cy))
+        boxes = np.asarray(detections, dtype=np.float32)[:, :4]
+        input_centroids = np.trunc((boxes[:, :2] + boxes[:, 2:]) / 2)
         
-        if len(self.tracks) == 0:
-            for centroid in input_centroids:
-                self.tracks[self.next_id] = {
-                    'centroid': centroid,
-                    'disappeared': 0
-                }
-                self.next_id += 1
+        if n == 0:
+            self._add(input_centroids, boxes)
         else:
-            # Calculate distances and assign
-            track_ids = list(self.tracks.keys())
-            track_centroids = [self.tracks[tid]['centroid'] for tid in track_ids]
+            # Pairwise distances between detections (rows) and tracks (cols)
+            cost = centroid_costs(input_centroids, self._centroids[:n], float(self.max_distance))  # Distance threshold
             
-            # Simple nearest neighbor assignment
-            used_rows = set()
-            used_cols = set()
-            assignments = {}
+            # Globally optimal assignment (Hungarian algorithm)
+            rows, cols = linear_sum_assignment(cost)
+            matched = cost[rows, cols] < self.max_distance
+            rows, cols = rows[matched], cols[matched]
             
-            for i, input_centroid in enumerate(input_centroids):
-                min_dist = float('inf')
-                best_track = None
-                
-                for j, track_id in enumerate(track_ids):
-                    if j in used_cols:
-                        continue
-                        
-                    track_centroid = track_centroids[j]
-                    dist = np.sqrt((input_centroid[0] - track_centroid[0])**2 + 
-                                 (input_centroid[1] - track_centroid[1])**2)
-                    
-                    if dist < min_dist and dist < 100:  # Distance threshold
-                        min_dist = dist
-                        best_track = track_id
-                        best_col = j
-                
-                if best_track is not None:
-                    assignments[i] = best_track
-                    used_rows.add(i)
-                    used_cols.add(best_col)
+            # Update existing tracks; velocity is measured from the position at the
+            # last update, undoing the extrapolation applied by predict() since then
+            last = self._centroids[cols] - self._velocities[cols] * steps
+            self._velocities[cols] = (input_centroids[rows] - last) / (steps + 1)
+            self._disappeared[:n] += elapsed
+            self._centroids[cols] = input_centroids[rows]
+            self._boxes[cols] = boxes[rows]
+            self._disappeared[cols] = 0
             
-            # Update existing tracks
-            for track_id in track_ids:
-                if track_id in assignments.values():
-                    input_idx = [k for k, v in assignments.items() if v == track_id][0]
-                    self.tracks[track_id]['centroid'] = input_centroids[input_idx]
-                    self.tracks[track_id]['disappeared'] = 0
-                else:
-                    self.tracks[track_id]['disappeared'] += 1
+            # Remove disappeared tracks
+            self._compact(self._disappeared[:n] <= self.max_disappeared)
             
             # Add new tracks for unassigned detections
-            for i, centroid in enumerate(input_centroids):
-                if i not in used_rows:
-                    self.tracks[self.next_id] = {
-                        'centroid': centroid,
-                        'disappeared': 0
-                    }
-                    self.next_id += 1
-            
-            # Remove disappeared tracks
-            for track_id in list(self.tracks.keys()):
-                if self.tracks[track_id]['disappeared'] > self.max_disappeared:
-                    del self.tracks[track_id]
+            unmatched = np.ones(len(input_centroids), dtype=bool)
+            unmatched[rows] = False
+            self._add(input_centroids[unmatched], boxes[unmatched])
         
-        return list(self.tracks.keys())
+        return self._ids[:self._n].tolist()
 
 def process_video(input_path, output_path):
+    """Render into a partial file and only move it to output_path once complete, so
+    /download never serves a video that is still being written or whose job failed."""
+    # Kept in a subfolder so the flat /download/<filename> route can never reach it
+    partial_dir = os.path.join(os.path.dirname(output_path), 'partial')
+    os.makedirs(partial_dir, exist_ok=True)
+    # Unique per job, so concurrent jobs for the same upload never share a file
+    fd, partial_path = tempfile.mkstemp(dir=partial_dir, suffix=os.path.splitext(output_path)[1])
+    os.close(fd)
+    try:
+        render_video(input_path, partial_path)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+def render_video(input_path, output_path):
     cap = cv2.VideoCapture(input_path)
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
     
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    detector = get_model()
+    out = open_writer(output_path, fps, width, height)
     
-    tracker = PersonTracker()
+    # Decode, inference and drawing/encoding run concurrently:
+    # decoder thread -> raw_q -> inference (this thread) -> annot_q -> writer thread
+    raw_q = queue.Queue(maxsize=2 * BATCH_SIZE)
+    annot_q = queue.Queue(maxsize=2 * BATCH_SIZE)
+    stop = threading.Event()
+    errors = []
     frame_count = 0
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Run YOLO detection
-        results = model(frame, verbose=False)
-        
-        # Extract person detections (class 0 is person in COCO)
-        person_detections = []
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    if box.cls == 0 and box.conf > 0.5:  # Person class with confidence > 0.5
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        person_detections.append((x1, y1, x2, y2))
-        
-        # Update tracker
-        track_ids = tracker.update(person_detections)
-        unique_count = len(track_ids)
-        
-        # Draw bounding boxes and annotations
-        for (x1, y1, x2, y2) in person_detections:
-            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-        
-        # Add unique person count text
-        text = f"Unique Persons: {unique_count}"
-        cv2.putText(frame, text, (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        
-        # Add frame number
-        frame_text = f"Frame: {frame_count}"
-        cv2.putText(frame, frame_text, (30, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        out.write(frame)
-        frame_count += 1
-        
-        if frame_count % 30 == 0:  # Progress indicator
-            print(f"Processed {frame_count} frames...")
+    # Preallocated frame buffers, handed back by the writer once a frame is encoded.
+    # Enough for a full detection batch plus a full raw_q, so decoding never starves
+    # the inference stage.
+    pool = queue.Queue()
+    for _ in range(BATCH_SIZE * DETECT_EVERY + raw_q.maxsize + 2):
+        pool.put(np.empty((height, width, 3), dtype=np.uint8))
     
-    cap.release()
-    out.release()
+    def get_buffer():
+        while not stop.is_set():
+            try:
+                return pool.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+    
+    def decode():
+        try:
+            for frame in read_frames(input_path, get_buffer):
+                raw_q.put(frame)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            raw_q.put(None)
+    
+    def write():
+        nonlocal frame_count
+        tracker = PersonTracker()
+        unique_count = 0
+        text_count = 0
+        text = "Unique Persons: 0"
+        try:
+            while True:
+                item = annot_q.get()
+                if item is None:
+                    break
+                frame, person_detections = item
+                
+                if person_detections is None:
+                    # Frame skipped by the detector, draw the extrapolated tracks instead
+                    person_detections = tracker.predict()
+                else:
+                    # Update tracker
+                    track_ids = tracker.update(person_detections)
+                    unique_count = len(track_ids)
+                
+                # Draw all bounding boxes in a single call, each as a closed 4-point contour
+                rects = person_detections.astype(np.int32)[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+                cv2.polylines(frame, rects, True, GREEN, 2)
+                
+                # Add unique person count text, only re-formatted when the count changes
+                if unique_count != text_count:
+                    text = f"Unique Persons: {unique_count}"
+                    text_count = unique_count
+                cv2.putText(frame, text, (30, 50), FONT, 1, RED, 2)
+                
+                # Add frame number
+                frame_text = f"Frame: {frame_count}"
+                cv2.putText(frame, frame_text, (30, 90), FONT, 0.7, WHITE, 2)
+                
+                out.write(frame)
+                pool.put(frame)
+                frame_count += 1
+                
+                if frame_count % 30 == 0:  # Progress indicator
+                    print(f"Processed {frame_count} frames...")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            # Keep draining so the inference stage never blocks on a full queue
+            while annot_q.get() is not None:
+                pass
+    
+    decoder = threading.Thread(target=decode, daemon=True)
+    writer = threading.Thread(target=write, daemon=True)
+    decoder.start()
+    writer.start()
+    
+    done = False
+    frame_index = 0
+    try:
+        while not done and not stop.is_set():
+            # Collect decoded frames until BATCH_SIZE of them need detection
+            batch = []
+            detect_frames = []
+            while len(detect_frames) < BATCH_SIZE:
+                frame = raw_q.get()
+                if frame is None:
+                    done = True
+                    break
+                detect = frame_index % DETECT_EVERY == 0
+                batch.append((frame, detect))
+                if detect:
+                    detect_frames.append(frame)
+                frame_index += 1
+            
+            if not batch:
+                break
+            
+            # Run YOLO detection on the whole batch at once
+            results = iter(detector(detect_frames, imgsz=IMG_SIZE, device=DEVICE, quantize=QUANTIZE, verbose=False)
+                           if detect_frames else [])
+            
+            for frame, detect in batch:
+                if not detect:
+                    annot_q.put((frame, None))
+                    continue
+                
+                # Extract person detections (class 0 is person in COCO)
+                result = next(results)
+                if result.boxes is None:
+                    person_detections = np.empty((0, 4), dtype=np.float32)
+                else:
+                    # Rows are (x1, y1, x2, y2, conf, cls); filter on the device so only
+                    # person boxes are copied back, in a single transfer
+                    data = result.boxes.data
+                    keep = (data[:, -1] == 0) & (data[:, -2] > 0.5)  # Person class with confidence > 0.5
+                    person_detections = data[keep, :4].cpu().numpy()
+                
+                annot_q.put((frame, person_detections))
+    finally:
+        # Drain the decoder if we stopped early so it can exit
+        if not done:
+            stop.set()
+            while raw_q.get() is not None:
+                pass
+        annot_q.put(None)
+        writer.join()
+        decoder.join()
+        out.release()
+    
+    if errors:
+        raise errors[0]
     print(f"Video processing complete! Total frames: {frame_count}")
 
 @app.route('/upload', methods=['POST'])
@@ -182,6 +502,12 @@ def upload_file():
             filepath = os.path.join(UPLOAD_FOLDER, filename)
             file.save(filepath)
             
+            # Remember where this upload lives so /process can find it without a directory scan
+            try:
+                redis_conn.set(f"upload:{file_id}", filename)
+            except RedisError as e:
+                print(f"Could not record upload {file_id} in Redis: {e}")
+            
             return jsonify({
                 'message': 'File uploaded successfully',
                 'file_id': file_id,
@@ -193,6 +519,40 @@ def upload_file():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def valid_file_id(file_id):
+    """True if file_id is a canonical UUID, as generated by /upload."""
+    try:
+        return str(uuid.UUID(file_id)) == file_id
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+def backfill_upload_index():
+    """Record upload:<file_id> for uploads that have no Redis mapping yet, e.g. ones
+    saved before the mapping existed or after Redis lost its data. Scans UPLOAD_FOLDER
+    once, so it runs at startup rather than on every /process miss."""
+    for filename in os.listdir(UPLOAD_FOLDER):
+        file_id = filename.split('_', 1)[0]
+        if valid_file_id(file_id):
+            redis_conn.set(f"upload:{file_id}", filename, nx=True)
+
+def find_upload(file_id, filename=None):
+    """Return the stored name of an upload, or None. Uses the filename returned by
+    /upload when the client passes it, otherwise the mapping recorded in Redis."""
+    if filename:
+        if (os.path.basename(filename) == filename and filename.startswith(f"{file_id}_")
+                and os.path.exists(os.path.join(UPLOAD_FOLDER, filename))):
+            return filename
+        return None
+    
+    try:
+        stored = redis_conn.get(f"upload:{file_id}")
+    except RedisError as e:
+        print(f"Could not look up upload {file_id} in Redis: {e}")
+        stored = None
+    if stored is not None and os.path.exists(os.path.join(UPLOAD_FOLDER, stored.decode())):
+        return stored.decode()
+    return None
+
 @app.route('/process', methods=['POST'])
 def process_video_endpoint():
     try:
@@ -201,14 +561,11 @@ def process_video_endpoint():
             return jsonify({'error': 'file_id is required'}), 400
         
         file_id = data['file_id']
+        if not valid_file_id(file_id):
+            return jsonify({'error': 'Invalid file_id'}), 400
         
         # Find the uploaded file
-        input_file = None
-        for filename in os.listdir(UPLOAD_FOLDER):
-            if filename.startswith(file_id):
-                input_file = filename
-                break
-        
+        input_file = find_upload(file_id, data.get('filename'))
         if not input_file:
             return jsonify({'error': 'File not found'}), 404
         
@@ -216,37 +573,74 @@ def process_video_endpoint():
         output_filename = f"processed_{input_file}"
         output_path = os.path.join(OUTPUT_FOLDER, output_filename)
         
-        # Process the video
-        print(f"Starting video processing for {input_file}...")
-        process_video(input_path, output_path)
+        # Hand the video to a background worker
+        job = job_queue.enqueue(process_video, input_path, output_path,
+                                job_timeout=JOB_TIMEOUT, result_ttl=JOB_RESULT_TTL, failure_ttl=JOB_RESULT_TTL,
+                                meta={'output_filename': output_filename})
+        print(f"Queued video processing for {input_file} as job {job.id}")
         
         return jsonify({
-            'message': 'Video processed successfully',
+            'message': 'Video queued for processing',
+            'job_id': job.id,
+            'status_url': f'/status/{job.id}',
             'output_filename': output_filename,
             'download_url': f'/download/{output_filename}'
-        }), 200
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def attachment_filename(filename):
+    """Content-Disposition filename parameters that stay Latin-1 encodable, with the
+    exact name in an RFC 5987 filename* parameter (same scheme as send_file)."""
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+    return {'filename': filename}
+
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
         file_path = os.path.join(OUTPUT_FOLDER, filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
+        if os.path.isfile(file_path):  # Not the partial/ folder of in-progress renders
+            if ACCEL_REDIRECT_PREFIX:
+                # Let nginx stream the file itself; the worker only sends headers
+                response = app.response_class(mimetype='application/octet-stream')
+                response.headers['X-Accel-Redirect'] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(filename)}"
+                response.headers.set('Content-Disposition', 'attachment', **attachment_filename(filename))
+                return response
+            return send_file(file_path, as_attachment=True, conditional=True, max_age=0)
         else:
             return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    try:
+        try:
+            job = Job.fetch(job_id, connection=redis_conn)
+        except NoSuchJobError:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        response = {'job_id': job.id, 'status': job.get_status()}
+        if job.is_finished:
+            output_filename = job.meta['output_filename']
+            response['download_url'] = f'/download/{output_filename}'
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/status')
 def status():
     return jsonify({
         'message': 'Person Counter API is running',
         'endpoints': {
             'upload': '/upload - POST with video file',
-            'process': '/process - POST with file_id',
+            'process': '/process - POST with file_id, returns a job_id',
+            'job_status': '/status/<job_id> - GET processing job status',
             'download': '/download/<filename> - GET processed video'
         }
     })
@@ -255,7 +649,9 @@ if __name__ == '__main__':
     print("Starting Person Counter API...")
     print("Endpoints:")
     print("- POST /upload - Upload video file")
-    print("- POST /process - Process uploaded video")
+    print("- POST /process - Queue uploaded video for processing")
+    print("- GET /status/<job_id> - Processing job status")
     print("- GET /download/<filename> - Download processed video")
     print("- GET /status - API status")
+    backfill_upload_index()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,5 @@
+# Production server settings, picked up automatically by `gunicorn app:app`
+bind = '0.0.0.0:5000'
+workers = 4
+threads = 2
+worker_class = 'gthread'
@@ -0,0 +1,15 @@
+"""Processing worker: loads the YOLO model once, then runs queued videos in-process.
+
+RQ's default worker forks a new process per job, which would reload the model
+(and re-initialize CUDA) for every video, so this uses SimpleWorker instead.
+"""
+from rq import SimpleWorker
+
+from app import backfill_upload_index, get_model, job_queue, redis_conn
+
+if __name__ == '__main__':
+    # Make uploads saved without a Redis mapping findable by /process
+    backfill_upload_index()
+    print("Loading YOLO model...")
+    get_model()
+    SimpleWorker([job_queue], connection=redis_conn).work()